@@ -0,0 +1,168 @@
+# asgi.py - ASGI entry point for upload-heavy traffic: uvicorn asgi:app (see README)
+import asyncio
+import functools
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+# The Flask application module (its file name is not a valid identifier)
+leaf = importlib.import_module('integrated-leaf-disease-project')
+
+# Largest image the async /api/predict accepts; defaults to the Flask routes' LEAF_MAX_UPLOAD_BYTES
+MAX_UPLOAD_BYTES = int(os.environ.get('LEAF_ASGI_MAX_UPLOAD_BYTES', str(leaf.MAX_UPLOAD_BYTES)))
+# Threads running the other Flask routes, like the request threads of one gthread worker
+WSGI_THREADS = leaf.serving_setting('threads', 'LEAF_WORKER_THREADS', 8)
+
+wsgi_executor = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='wsgi')
+# Short blocking steps of the async path: decode submission, cache writes, ledger and ERP records
+record_executor = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='record')
+
+class ClientDisconnected(Exception):
+    """The client went away before its upload was complete"""
+
+def header(scope, name, default=''):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return default
+
+def query_args(scope):
+    """First value of each query string parameter, like Flask's request.args.get"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+    return {name: values[0] for name, values in query.items()}
+
+async def send_json(send, status, payload):
+    # Same body as jsonify outside debug mode
+    body = (json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n').encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def receive_upload(scope, receive, field='file'):
+    """Feed a multipart body to leaf.UploadParser as it streams in and return the image part"""
+    length = header(scope, b'content-length')
+    parser = leaf.UploadParser(header(scope, b'content-type'), int(length) if length.isdigit() else None,
+                               field, MAX_UPLOAD_BYTES)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if body:
+            parser.feed(body)
+        if not more_body and not parser.done:
+            parser.feed(b'')
+    return parser.result()
+
+def record(user_id, image_hash, model_version, probabilities, stage, image_dhash=None):
+    if stage != leaf.CACHE_STAGE:
+        leaf.prediction_cache.put(image_hash, model_version, probabilities)
+    if stage not in (leaf.CACHE_STAGE, leaf.NEAR_DUPLICATE_STAGE):
+        leaf.near_duplicates.add(image_dhash, model_version, probabilities)
+    return leaf.record_prediction(user_id, image_hash, probabilities, stage)
+
+async def predict_upload(image_bytes, image_hash, user_id):
+    """predict_image for the event loop: decoding and batched inference are awaited, not waited on by a thread"""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        if not leaf.model_registry.ready:
+            await loop.run_in_executor(record_executor, leaf.model_registry.current)
+        model_version = leaf.model_registry.version
+        with leaf.stage_seconds.time('cache_lookup'):
+            probabilities = leaf.prediction_cache.get(image_hash, model_version)
+        stage = leaf.CACHE_STAGE
+        image_dhash = None
+        if probabilities is None:
+            # Submitting blocks only while every decode slot is taken, so it runs off the event loop
+            decoding = await loop.run_in_executor(record_executor, leaf.preprocess_pool.submit, image_bytes)
+            pixels, _ = await asyncio.wrap_future(decoding)
+            # A 9x8 thumbnail and a few bucket probes: cheap enough for the event loop
+            image_dhash, probabilities = leaf.find_near_duplicate(pixels, model_version)
+            stage = leaf.NEAR_DUPLICATE_STAGE
+            if probabilities is None:
+                row, stage = await asyncio.wrap_future(leaf.batch_scheduler.submit(pixels))
+                probabilities = row.tolist()
+        result = await loop.run_in_executor(record_executor, record, user_id, image_hash, model_version,
+                                            probabilities, stage, image_dhash)
+        leaf.stage_seconds.observe(time.perf_counter() - started, 'predict_total')
+        return result
+    except Exception as e:
+        return leaf.prediction_error(e)
+
+async def api_predict(scope, receive, send):
+    """Async /api/predict with the same responses as the Flask route"""
+    started = time.perf_counter()
+    status = 200
+    try:
+        if not leaf.valid_api_key(header(scope, b'x-api-key')):
+            status = 403
+            await send_json(send, status, {'error': 'Invalid API key'})
+            return
+        try:
+            upload_started = time.perf_counter()
+            upload = await receive_upload(scope, receive)
+            leaf.stage_seconds.observe(time.perf_counter() - upload_started, 'upload_read')
+        except leaf.UploadError as e:
+            status = e.status
+            await send_json(send, status, {'error': str(e)})
+            return
+        user_id = header(scope, b'x-user-id', 'api_user')
+        if leaf.wants_tiles(upload.fields, query_args(scope)):
+            # One upload's tiles already make a full batch, so it is classified on a request thread
+            result = await asyncio.get_running_loop().run_in_executor(
+                wsgi_executor, functools.partial(leaf.predict_image_tiled, upload.data, user_id,
+                                                 image_hash=upload.image_hash))
+        else:
+            result = await predict_upload(upload.data, upload.image_hash, user_id)
+        await send_json(send, status, result)
+    except ClientDisconnected:
+        status = 499  # Nothing is sent; counted like nginx's "client closed request"
+    finally:
+        leaf.http_requests_total.inc('api_predict', status)
+        leaf.http_request_seconds.observe(time.perf_counter() - started, 'api_predict')
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    """Runs a Flask request on the WSGI thread pool once its body has been received"""
+    async def run_wsgi_app(self, body):
+        # asgiref would run every WSGI call on one shared thread, one request at a time
+        run = WsgiToAsgiInstance.run_wsgi_app.__wrapped__
+        await sync_to_async(run, thread_sensitive=False, executor=wsgi_executor)(self, body)
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+flask_routes = PooledWsgiToAsgi(leaf.app)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            wsgi_executor.shutdown(wait=False)
+            record_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI application: async /api/predict, every other route served by the Flask app"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/predict' and scope['method'] == 'POST':
+        await api_predict(scope, receive, send)
+    else:
+        # Uploads to / are also received asynchronously before a thread picks the request up
+        await flask_routes(scope, receive, send)
@@ -0,0 +1,166 @@
+# autotune.py - Finds the thread, worker and batch settings that serve fastest on this host
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import threading
+import time
+
+from benchmark import load_app, percentile, print_table, synthetic_leaf
+
+def powers_of_two(limit):
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+def candidate_settings(args, cpus):
+    """Worker/thread combinations to try; workers x intra-op threads never exceeds the core count"""
+    settings = []
+    for workers in args.workers or powers_of_two(cpus):
+        for torch_threads in args.torch_threads or powers_of_two(cpus):
+            if workers * torch_threads > cpus:
+                continue
+            for interop_threads in args.interop_threads:
+                settings.append({'workers': workers, 'torch_threads': torch_threads,
+                                 'interop_threads': interop_threads})
+    if args.include_default:
+        # Torch's default of one intra-op thread per core in every worker, for comparison
+        for workers in sorted({1, cpus}):
+            default = {'workers': workers, 'torch_threads': cpus, 'interop_threads': cpus}
+            if default not in settings:
+                settings.append(default)
+    return settings
+
+def _trial_worker(settings, args, image, barrier, results):
+    """One server worker: apply the thread settings before torch starts, then serve each batch size"""
+    os.environ.update({
+        'LEAF_TORCH_THREADS': str(settings['torch_threads']),
+        'LEAF_INTEROP_THREADS': str(settings['interop_threads']),
+        'LEAF_PREPROCESS_WORKERS': str(settings['torch_threads']),
+        'LEAF_LEDGER_PATH': ':memory:',
+        'LEAF_FAKE_FIRESTORE': '1'
+    })
+    app = load_app()
+
+    for batch_size in args.batch_sizes:
+        scheduler = app.BatchScheduler(app.model_registry, max_batch_size=batch_size)
+        scheduler.submit(app.preprocess_pool.decode(image)).result()
+        latencies = []
+        lock = threading.Lock()
+        barrier.wait()
+        deadline = time.perf_counter() + args.seconds
+
+        # Request threads of one gunicorn gthread worker: decode on the pool, then batched inference
+        def client():
+            local = []
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                scheduler.submit(app.preprocess_pool.decode(image)).result()
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=client) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        scheduler.close()
+        results.put((batch_size, latencies))
+
+def run_trial(settings, args, image):
+    """Serve with `workers` processes at once and measure throughput and latency per batch size"""
+    context = multiprocessing.get_context('spawn')  # Fresh interpreters, so thread settings apply
+    barrier = context.Barrier(settings['workers'])
+    results = context.Queue()
+    workers = [context.Process(target=_trial_worker, args=(settings, args, image, barrier, results))
+               for _ in range(settings['workers'])]
+    for worker in workers:
+        worker.start()
+
+    latencies = {batch_size: [] for batch_size in args.batch_sizes}
+    for _ in range(settings['workers'] * len(args.batch_sizes)):
+        batch_size, values = results.get()
+        latencies[batch_size].extend(values)
+    for worker in workers:
+        worker.join()
+
+    rows = []
+    for batch_size, values in latencies.items():
+        rows.append({
+            **settings,
+            'batch_size': batch_size,
+            'requests_per_sec': round(len(values) / args.seconds, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 1),
+            'p99_ms': round(percentile(values, 99) * 1000, 1)
+        })
+    return rows
+
+def choose(rows, max_p99_ms):
+    """Highest throughput within the latency budget, or the lowest p99 when nothing meets it"""
+    within = [row for row in rows if max_p99_ms is None or row['p99_ms'] <= max_p99_ms]
+    if within:
+        return max(within, key=lambda row: row['requests_per_sec'])
+    return min(rows, key=lambda row: row['p99_ms'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune CPU serving settings for this host')
+    parser.add_argument('--output', default=os.environ.get('LEAF_SERVING_CONFIG', 'serving_config.json'))
+    parser.add_argument('--workers', type=int, nargs='+', help='Server worker counts (default: powers of two)')
+    parser.add_argument('--torch-threads', type=int, nargs='+', help='Intra-op threads per worker')
+    parser.add_argument('--interop-threads', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent requests per worker')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Measurement time per batch size')
+    parser.add_argument('--max-p99-ms', type=float, help='Latency budget for the chosen configuration')
+    parser.add_argument('--include-default', action='store_true',
+                        help="Also measure torch's default threading for comparison")
+    parser.add_argument('--quick', action='store_true', help='Small grid for startup tuning')
+    args = parser.parse_args()
+    if args.quick:
+        args.interop_threads = args.interop_threads[:1]
+        args.batch_sizes = [1, 8]
+        args.seconds = min(args.seconds, 1.5)
+
+    cpus = os.cpu_count() or 1
+    image = synthetic_leaf(1280, 960, 'JPEG')
+    settings = candidate_settings(args, cpus)
+    print(f'{cpus} CPUs, {len(settings)} worker/thread settings x {len(args.batch_sizes)} batch sizes')
+
+    rows = []
+    for trial in settings:
+        trial_rows = run_trial(trial, args, image)
+        best = max(trial_rows, key=lambda row: row['requests_per_sec'])
+        print(f"  workers={trial['workers']} torch_threads={trial['torch_threads']} "
+              f"interop_threads={trial['interop_threads']}: {best['requests_per_sec']} req/s "
+              f"at batch {best['batch_size']}")
+        rows.extend(trial_rows)
+
+    print_table(rows, ['workers', 'torch_threads', 'interop_threads', 'batch_size',
+                       'requests_per_sec', 'p50_ms', 'p99_ms'])
+    best = choose([row for row in rows if row['workers'] * row['torch_threads'] <= cpus], args.max_p99_ms)
+    config = {
+        'workers': best['workers'],
+        'threads': args.threads,
+        'torch_threads': best['torch_threads'],
+        'interop_threads': best['interop_threads'],
+        'preprocess_workers': best['torch_threads'],
+        'batch_size': best['batch_size'],
+        'expected': {key: best[key] for key in ('requests_per_sec', 'p50_ms', 'p99_ms')},
+        'host': {'cpus': cpus, 'machine': platform.machine(), 'python': platform.python_version()},
+        'tuned_at': datetime.datetime.now().isoformat(),
+        'results': rows
+    }
+    with open(args.output, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"Best: {best['workers']} workers x {best['torch_threads']} intra-op threads, "
+          f"{best['interop_threads']} inter-op, batch {best['batch_size']} "
+          f"({best['requests_per_sec']} req/s, p99 {best['p99_ms']} ms) -> {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1040 @@
+# benchmark.py - Performance benchmarks for the Leaf Disease Detection System
+import argparse
+import datetime
+import gc
+import http.cookiejar
+import importlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+import uuid
+
+def load_app():
+    """Import the Flask application module (its file name is not a valid identifier) and wait for the model"""
+    app = importlib.import_module('integrated-leaf-disease-project')
+    app.model_registry.current()  # Measurements and forked workers must not overlap the background warm-up
+    return app
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def print_table(rows, columns):
+    """Print a list of result dicts as an aligned text table"""
+    widths = [max(len(col), *(len(f"{row[col]}") for row in rows)) for col in columns]
+    print('  '.join(col.rjust(width) for col, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(f"{row[col]}".rjust(width) for col, width in zip(columns, widths)))
+
+# ------ BATCHING ------
+def bench_batching(args):
+    """Latency and throughput of the micro-batching scheduler per maximum batch size"""
+    app = load_app()
+    results = []
+
+    for batch_size in args.batch_sizes:
+        scheduler = app.BatchScheduler(app.model_registry, max_batch_size=batch_size, max_wait_ms=args.max_wait_ms)
+        image = app.np.random.randint(0, 256, (app.IMAGE_SIZE, app.IMAGE_SIZE, 3), dtype=app.np.uint8)
+        scheduler.submit(image).result()  # start the worker thread outside the timing
+
+        latencies = []
+        lock = threading.Lock()
+        per_client = max(1, args.requests // args.clients)
+
+        def client():
+            local = []
+            for _ in range(per_client):
+                start = time.perf_counter()
+                scheduler.submit(image).result()
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        scheduler.close()
+
+        results.append({
+            'max_batch_size': batch_size,
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'images_per_sec': round(len(latencies) / elapsed, 1)
+        })
+
+    print_table(results, ['max_batch_size', 'requests', 'p50_ms', 'p99_ms', 'images_per_sec'])
+    return results
+
+# ------ LEDGER ------
+def bench_ledger(args):
+    """Append, cold-start, verification and inclusion-proof cost of the SQLite ledger"""
+    app = load_app()
+    results = []
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ledger.db')
+            ledger = app.SimpleBlockchain(path, max_transactions=args.block_size, max_seconds=0)
+            start = time.perf_counter()
+            for offset in range(0, size, args.block_size):
+                count = min(args.block_size, size - offset)
+                ledger.add_transactions(
+                    ('bench_user', f'{offset + i:064x}', 'Anthracnose') for i in range(count)
+                )
+            append_seconds = time.perf_counter() - start
+            ledger.close()
+
+            start = time.perf_counter()
+            ledger = app.SimpleBlockchain(path, max_transactions=args.block_size, max_seconds=0)
+            open_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            assert ledger.verify(full=True)
+            full_seconds = time.perf_counter() - start
+
+            ledger.add_transactions(('bench_user', f'{i:064x}', 'Anthracnose') for i in range(args.block_size))
+            start = time.perf_counter()
+            assert ledger.verify()
+            incremental_seconds = time.perf_counter() - start
+
+            # Inclusion proofs for random images across the ledger
+            samples = [f'{random.randrange(size):064x}' for _ in range(args.proofs)]
+            start = time.perf_counter()
+            proofs = [ledger.prove(image_hash) for image_hash in samples]
+            prove_seconds = (time.perf_counter() - start) / len(samples)
+            start = time.perf_counter()
+            for proof in proofs:
+                assert app.verify_merkle_proof(proof['transaction'], proof['proof'], proof['merkle_root'])
+            check_seconds = (time.perf_counter() - start) / len(samples)
+            ledger.close()
+
+        results.append({
+            'transactions': size,
+            'append_tx_per_sec': round(size / append_seconds),
+            'open_ms': round(open_seconds * 1000, 2),
+            'full_verify_s': round(full_seconds, 3),
+            'incremental_verify_ms': round(incremental_seconds * 1000, 2),
+            'proof_ms': round(prove_seconds * 1000, 3),
+            'proof_verify_us': round(check_seconds * 1e6, 1),
+            'proof_hashes': len(proofs[0]['proof'])
+        })
+
+    print_table(results, ['transactions', 'append_tx_per_sec', 'open_ms', 'full_verify_s',
+                          'incremental_verify_ms', 'proof_ms', 'proof_verify_us', 'proof_hashes'])
+    return results
+
+# ------ RECORDS ------
+def bench_records(args):
+    """Memory per million ERP records: list of dicts versus the columnar RecordStore"""
+    app = load_app()
+    base = datetime.datetime(2026, 1, 1)
+
+    def make_record(i):
+        # Fresh strings per record, as request handling produces them
+        return {
+            'record_id': str(uuid.uuid4()),
+            'user_id': f'{uuid.UUID(int=i % args.users)}',
+            'prediction': app.classes[i % len(app.classes)],
+            'confidence': float(i % 10000) / 100,
+            'timestamp': (base + datetime.timedelta(seconds=i)).isoformat()
+        }
+
+    def measure(build):
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = build()
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return store, current, peak, seconds
+
+    def build_dicts():
+        return [make_record(i) for i in range(args.count)]
+
+    def build_columnar(directory=None):
+        def build():
+            store = app.RecordStore(directory, spill_rows=args.spill_rows)
+            for i in range(args.count):
+                store.append(make_record(i))
+            store.spill()
+            return store
+        return build
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, build in (('dicts', build_dicts),
+                            ('columnar', build_columnar()),
+                            ('columnar+mmap', build_columnar(tmp))):
+            store, current, peak, seconds = measure(build)
+            results.append({
+                'storage': name,
+                'records': args.count,
+                'bytes_per_record': round(current / args.count, 1),
+                'mb_per_million': round(current / args.count * 1e6 / 2 ** 20, 1),
+                'peak_mb': round(peak / 2 ** 20, 1),
+                'insert_per_sec': round(args.count / seconds)
+            })
+            if hasattr(store, 'close'):
+                store.close()
+            del store
+
+    print_table(results, ['storage', 'records', 'bytes_per_record', 'mb_per_million', 'peak_mb', 'insert_per_sec'])
+    return results
+
+# ------ PREPROCESSING ------
+def synthetic_leaf(width, height, fmt, seed=0):
+    """Encode a synthetic leaf-like photo (green blob with lesions on soil) in the given format"""
+    from PIL import Image, ImageDraw, ImageFilter
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (rng.randint(80, 120), rng.randint(60, 90), 40))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width * 0.15, height * 0.1, width * 0.85, height * 0.9), fill=(40, rng.randint(110, 160), 50))
+    for _ in range(40):
+        x, y, r = rng.uniform(0.2, 0.8) * width, rng.uniform(0.2, 0.8) * height, rng.uniform(0.005, 0.02) * width
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(rng.randint(60, 120), rng.randint(40, 80), 20))
+    image = image.filter(ImageFilter.GaussianBlur(2))
+    if fmt == 'PNG-RGBA':
+        image, fmt = image.convert('RGBA'), 'PNG'
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=90) if fmt == 'JPEG' else image.save(buffer, fmt)
+    return buffer.getvalue()
+
+def _preprocess_worker(path, data, repeats, results):
+    """Time one preprocessing path in a fresh process and report its peak RSS growth"""
+    app = load_app()
+    from PIL import Image
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    buffer = app.new_batch_buffer(1)
+    transform = app.reference_transform()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if path == 'torchvision':
+            transform(Image.open(io.BytesIO(data)).convert('RGB')).unsqueeze(0)
+        else:
+            app.normalize_into(app.decode_image(data), buffer[0])
+    seconds = (time.perf_counter() - start) / repeats
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((seconds, (peak - baseline) / 1024))
+
+def bench_preprocess(args):
+    """Per-image preprocessing time and peak memory: torchvision transform vs the optimized path"""
+    context = multiprocessing.get_context('spawn')  # Each worker loads the app itself
+    results = []
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        for fmt in args.formats:
+            data = synthetic_leaf(width, height, fmt)
+            row = {'image': f'{size} {fmt}', 'kb': round(len(data) / 1024)}
+            for path in ('torchvision', 'optimized'):
+                queue = context.Queue()
+                worker = context.Process(target=_preprocess_worker, args=(path, data, args.repeats, queue))
+                worker.start()
+                seconds, peak_mb = queue.get()
+                worker.join()
+                row[f'{path}_ms'] = round(seconds * 1000, 2)
+                row[f'{path}_peak_mb'] = round(peak_mb, 1)
+            row['speedup'] = round(row['torchvision_ms'] / row['optimized_ms'], 2)
+            results.append(row)
+
+    print_table(results, ['image', 'kb', 'torchvision_ms', 'optimized_ms', 'speedup',
+                          'torchvision_peak_mb', 'optimized_peak_mb'])
+    return results
+
+def bench_pool(args):
+    """Preprocessing throughput of the decode pool per worker count and executor type"""
+    app = load_app()
+    width, height = (int(v) for v in args.size.split('x'))
+    images = [synthetic_leaf(width, height, 'JPEG', seed) for seed in range(8)]
+    results = []
+
+    for kind in args.executors:
+        baseline = None
+        for workers in args.workers:
+            pool = app.PreprocessPool(workers=workers, kind=kind, max_pending=max(1, 4 * workers))
+            pool.decode(images[0])  # start the workers outside the timing
+            start = time.perf_counter()
+            # A batch request keeps `lookahead` decodes in flight, like preprocess_stage
+            in_flight = []
+            for i in range(args.images):
+                in_flight.append(pool.submit(images[i % len(images)]))
+                if len(in_flight) >= pool.lookahead:
+                    in_flight.pop(0).result()
+            for future in in_flight:
+                future.result()
+            elapsed = time.perf_counter() - start
+            pool.close()
+
+            rate = args.images / elapsed
+            baseline = baseline or rate
+            results.append({
+                'executor': kind,
+                'workers': workers,
+                'images': args.images,
+                'images_per_sec': round(rate, 1),
+                'speedup': round(rate / baseline, 2)
+            })
+
+    print(f'{os.cpu_count()} CPUs, {args.size} JPEG')
+    print_table(results, ['executor', 'workers', 'images', 'images_per_sec', 'speedup'])
+    return results
+
+# ------ INFERENCE MODES ------
+def resident_mb(pid='self'):
+    """Current resident set size of this process, or of another one by pid"""
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+def serialized_mb(app, model):
+    """Size of the model as it would be saved to disk"""
+    if isinstance(model, app.OnnxModel):
+        return len(model.onnx_bytes) / 2 ** 20
+    if isinstance(model, app.torch.jit.ScriptModule):
+        return None  # Frozen graphs hold MKLDNN-packed weights that are not serialized
+    buffer = io.BytesIO()
+    app.torch.save(model.state_dict(), buffer)
+    return len(buffer.getvalue()) / 2 ** 20
+
+def _mode_worker(mode, args, results):
+    """Build one inference mode in a fresh process and time it at batch 1 and at the largest batch"""
+    app = load_app()
+    torch = app.torch
+    try:
+        before = resident_mb()
+        eager = app.load_model(app.MODEL_PATH)
+        calibration = app.calibration_images()
+        start = time.perf_counter()
+        model = app.optimize_model(eager, mode, calibration)
+        drift = app.measure_drift(eager, model, calibration)
+        build_seconds = time.perf_counter() - start
+        del eager
+        gc.collect()
+        memory_mb = resident_mb() - before
+
+        single = torch.randn(1, 3, app.IMAGE_SIZE, app.IMAGE_SIZE)
+        batch = torch.randn(args.batch_size, 3, app.IMAGE_SIZE, app.IMAGE_SIZE)
+        latencies = []
+        with torch.no_grad():
+            model(single)
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                model(single)
+                latencies.append(time.perf_counter() - start)
+            model(batch)
+            start = time.perf_counter()
+            for _ in range(max(1, args.repeats // 4)):
+                model(batch)
+            batch_seconds = (time.perf_counter() - start) / max(1, args.repeats // 4)
+
+        model_mb = serialized_mb(app, model)
+        results.put({
+            'mode': mode,
+            'build_s': round(build_seconds, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'images_per_sec': round(args.batch_size / batch_seconds, 1),
+            'model_mb': None if model_mb is None else round(model_mb, 1),
+            'rss_growth_mb': round(memory_mb, 1),
+            'max_drift': round(drift['max_abs_diff'], 5),
+            'top1_agreement': drift['top1_agreement']
+        })
+    except Exception as e:
+        results.put({'mode': mode, 'error': f'{type(e).__name__}: {e}'})
+
+def bench_modes(args):
+    """Latency, throughput, memory and accuracy drift of each CPU inference mode"""
+    # Spawned, not forked: the loaded app runs warm-up, writer and torch threads a fork could deadlock on
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for mode in args.modes:
+        queue = context.Queue()
+        worker = context.Process(target=_mode_worker, args=(mode, args, queue))
+        worker.start()
+        row = queue.get()
+        worker.join()
+        if 'error' in row:
+            print(f"{mode}: {row['error']}")
+        results.append(row)
+
+    print_table([row for row in results if 'error' not in row],
+                ['mode', 'build_s', 'p50_ms', 'p99_ms', 'images_per_sec', 'model_mb', 'rss_growth_mb',
+                 'max_drift', 'top1_agreement'])
+    return results
+
+# ------ STARTUP ------
+SERVER_SCRIPT = """
+import importlib, sys
+sys.path.insert(0, {path!r})
+from werkzeug.serving import make_server
+module = importlib.import_module('integrated-leaf-disease-project')
+make_server('127.0.0.1', {port}, module.app, threaded=True).serve_forever()
+"""
+
+def http_status(url, data=None, headers=None):
+    """Status code of a request, or None while nothing is listening"""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers or {}), timeout=60) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+def multipart_image(data, filename='leaf.jpg'):
+    """Encode an image upload as the body and headers of a multipart/form-data POST"""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}', 'X-API-Key': 'demo_api_key'}
+
+def bench_startup(args):
+    """Time from process start to first HTTP response, readiness and first prediction"""
+    path = os.path.abspath(args.app_dir)
+    image = synthetic_leaf(640, 480, 'JPEG')
+    results = []
+    for run in range(args.runs):
+        port = args.port + run
+        base = f'http://127.0.0.1:{port}'
+        env = dict(os.environ, LEAF_LEDGER_PATH=':memory:')
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT.format(path=path, port=port)], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while http_status(f'{base}/api/ready') is None:
+                if server.poll() is not None:
+                    raise RuntimeError('Server exited during startup')
+                time.sleep(0.005)
+            first_response = time.perf_counter() - start
+            # Older builds have no readiness endpoint (404); they are ready once they respond
+            while http_status(f'{base}/api/ready') == 503:
+                time.sleep(0.005)
+            ready = time.perf_counter() - start
+            # Unique bytes so the prediction cache cannot answer
+            body, headers = multipart_image(image + uuid.uuid4().bytes)
+            status = http_status(f'{base}/api/predict', body, headers)
+            first_prediction = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        results.append({
+            'run': run + 1,
+            'first_response_s': round(first_response, 2),
+            'ready_s': round(ready, 2),
+            'first_prediction_s': round(first_prediction, 2),
+            'status': status
+        })
+
+    print_table(results, ['run', 'first_response_s', 'ready_s', 'first_prediction_s', 'status'])
+    return results
+
+# ------ METRICS ------
+def bench_metrics(args):
+    """Cost of one metric update, and of full instrumentation on the cheapest (cache hit) prediction"""
+    app = load_app()
+    histogram = app.Histogram('bench_seconds', 'Benchmark histogram', ('stage',))
+    counter = app.Counter('bench_total', 'Benchmark counter', ('class',))
+
+    def timed_block():
+        with histogram.time('forward'):
+            pass
+
+    operations = {
+        'histogram.observe': lambda: histogram.observe(0.003, 'forward'),
+        'histogram.time': timed_block,
+        'counter.inc': lambda: counter.inc('Healthy')
+    }
+    results = []
+    for name, operation in operations.items():
+        start = time.perf_counter()
+        for _ in range(args.operations):
+            operation()
+        results.append({'measure': name, 'ns_per_call': round((time.perf_counter() - start) / args.operations * 1e9)})
+
+    instruments = [metric for metric in app.metrics._metrics if hasattr(metric, 'enabled')]
+    image = synthetic_leaf(640, 480, 'JPEG')
+    app.predict_image(image, 'bench')  # cache the prediction so only the instrumented bookkeeping remains
+    for enabled in (False, True):
+        for metric in instruments:
+            metric.enabled = enabled
+        start = time.perf_counter()
+        for _ in range(args.predictions):
+            app.predict_image(image, 'bench')
+        elapsed = time.perf_counter() - start
+        results.append({'measure': f"cached predict_image ({'metrics on' if enabled else 'metrics off'})",
+                        'ns_per_call': round(elapsed / args.predictions * 1e9)})
+
+    print_table(results, ['measure', 'ns_per_call'])
+    return results
+
+# ------ MODEL CASCADE ------
+def labelled_images(app, data_dir, limit):
+    """(image bytes, class index or None) for the photos under DIR; DIR/<class>/ subfolders provide labels"""
+    items = []
+    for root, _, files in sorted(os.walk(data_dir)):
+        label = os.path.basename(root)
+        index = app.classes.index(label) if label in app.classes else None
+        for name in sorted(files):
+            if name.lower().endswith(app.IMAGE_EXTENSIONS):
+                with open(os.path.join(root, name), 'rb') as f:
+                    items.append((f.read(), index))
+    random.Random(0).shuffle(items)
+    return items[:limit]
+
+def bench_cascade(args):
+    """Accuracy, escalation rate and throughput of the model cascade per confidence threshold"""
+    app = load_app()
+    torch = app.torch
+    first = app.load_first_stage(args.first_stage)
+    if first is None:
+        raise SystemExit(f'Could not load the first-stage model {args.first_stage} (train one with distill.py)')
+    full, mode, _ = app.prepare_inference_model(app.load_model(app.MODEL_PATH), args.mode)
+
+    if args.data:
+        items = labelled_images(app, args.data, args.images)
+    else:
+        items = [(synthetic_leaf(640, 480, 'JPEG', seed), None) for seed in range(args.images)]
+    images = torch.stack([app.preprocess_image(data) for data, _ in items])
+    labels = [label for _, label in items]
+    labelled = [i for i, label in enumerate(labels) if label is not None]
+
+    def run(model):
+        """Top-1 class and answering stage of every image, and the images classified per second"""
+        predictions, stages = [], []
+        app.infer_batch(model, images[:args.batch_size])  # warm-up
+        start = time.perf_counter()
+        for i in range(0, len(images), args.batch_size):
+            probabilities, batch_stages = app.infer_batch(model, images[i:i + args.batch_size])
+            predictions.extend(probabilities.argmax(1).tolist())
+            stages.extend(batch_stages)
+        return predictions, stages, len(images) / (time.perf_counter() - start)
+
+    def row(threshold, predictions, stages, rate):
+        correct = sum(predictions[i] == labels[i] for i in labelled)
+        return {
+            'threshold': threshold,
+            'escalated_pct': round(100 * stages.count(app.FULL_STAGE) / len(stages), 1),
+            'accuracy': round(correct / len(labelled), 4) if labelled else None,
+            'agreement': round(sum(a == b for a, b in zip(predictions, reference)) / len(reference), 4),
+            'images_per_sec': round(rate, 1),
+            'speedup': round(rate / full_rate, 2)
+        }
+
+    reference, stages, full_rate = run(full)
+    results = [row('full', reference, stages, full_rate)]
+    for threshold in args.thresholds:
+        results.append(row(f'{threshold:.2f}', *run(app.CascadeModel(first, full, threshold))))
+
+    source = args.data or 'synthetic photos (no labels)'
+    print(f'{len(images)} images from {source}, {len(labelled)} labelled; full model in {mode} mode')
+    print_table(results, ['threshold', 'escalated_pct', 'accuracy', 'agreement', 'images_per_sec', 'speedup'])
+    return results
+
+# ------ TILED INFERENCE ------
+def bench_tiles(args):
+    """Single-crop vs tiled latency per photo size and tile cap"""
+    app = load_app()
+    model = app.model_registry.get()
+    results = []
+    for size in args.sizes:
+        width, height = (int(v) for v in size.split('x'))
+        data = synthetic_leaf(width, height, 'JPEG')
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            app.infer_batch(model, app.preprocess_image(data).unsqueeze(0))
+        single_ms = (time.perf_counter() - start) / args.repeats * 1000
+        for max_tiles in args.max_tiles:
+            decode_seconds = infer_seconds = 0.0
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                tiles, grid = app.decode_tiles(data, max_tiles=max_tiles)
+                images = app.normalize_batch(tiles, app.new_batch_buffer(len(tiles)))
+                decoded = time.perf_counter()
+                app.infer_batch(model, images)
+                decode_seconds += decoded - start
+                infer_seconds += time.perf_counter() - decoded
+            tiled_ms = (decode_seconds + infer_seconds) / args.repeats * 1000
+            results.append({
+                'image': size,
+                'max_tiles': max_tiles,
+                'tiles': f"{grid['rows']}x{grid['cols']}",
+                'single_ms': round(single_ms, 1),
+                'decode_ms': round(decode_seconds / args.repeats * 1000, 1),
+                'infer_ms': round(infer_seconds / args.repeats * 1000, 1),
+                'tiled_ms': round(tiled_ms, 1),
+                'slowdown': round(tiled_ms / single_ms, 1)
+            })
+
+    print_table(results, ['image', 'max_tiles', 'tiles', 'single_ms', 'decode_ms', 'infer_ms', 'tiled_ms', 'slowdown'])
+    return results
+
+# ------ NEAR-DUPLICATE INDEX ------
+def edited_copies(data):
+    """(edit, bytes) for the re-uploads the near-duplicate index should recognise"""
+    from PIL import Image, ImageEnhance
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    width, height = image.size
+
+    def encode(edited, fmt='JPEG', quality=90):
+        buffer = io.BytesIO()
+        edited.save(buffer, fmt, quality=quality)
+        return buffer.getvalue()
+
+    return [
+        ('png', encode(image, 'PNG')),
+        ('jpeg q40', encode(image, quality=40)),
+        ('resize 50%', encode(image.resize((width // 2, height // 2)))),
+        ('resize 640 q60', encode(image.resize((640, 640 * height // width)), quality=60)),
+        ('brighter 15%', encode(ImageEnhance.Brightness(image).enhance(1.15))),
+        ('crop 2%', encode(image.crop((width // 50, height // 50, width - width // 50, height - height // 50)))),
+        ('crop 5%', encode(image.crop((width // 20, height // 20, width - width // 20, height - height // 20))))
+    ]
+
+def bench_near_duplicates(args):
+    """dHash distance of edited re-uploads vs other photos, and index lookup, insert and load time at scale"""
+    app = load_app()
+    import numpy as np
+
+    def dhash(data):
+        return app.dhash(app.decode_image(data))
+
+    if args.data:
+        photos = [data for data, _ in labelled_images(app, args.data, args.photos)]
+    else:
+        photos = [synthetic_leaf(2000, 1500, 'JPEG', seed) for seed in range(args.photos)]
+    hashes = [dhash(data) for data in photos]
+    results = []
+    edits = {}
+    for data, original in zip(photos, hashes):
+        for edit, copy in edited_copies(data):
+            edits.setdefault(edit, []).append(bin(original ^ dhash(copy)).count('1'))
+    others = [bin(a ^ b).count('1') for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+    for edit, distances in [*edits.items(), ('different photo', others)]:
+        results.append({
+            'measure': edit,
+            'median_bits': percentile(distances, 50),
+            'max_bits': max(distances),
+            'within_radius_pct': round(100 * sum(d <= args.radius for d in distances) / len(distances), 1)
+        })
+
+    rng = np.random.default_rng(0)
+    random_hashes = rng.integers(0, 2 ** 64 - 1, args.entries, dtype=np.uint64, endpoint=True)
+    probabilities = [1 / len(app.classes)] * len(app.classes)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'near_duplicates.bin')
+        index = app.NearDuplicateIndex(path, radius=args.radius)
+        start = time.perf_counter()
+        for value in random_hashes.tolist():
+            index.add(value, 'bench', probabilities)
+        add_seconds = (time.perf_counter() - start) / args.entries
+        index.close()
+        start = time.perf_counter()
+        index = app.NearDuplicateIndex(path, radius=args.radius)
+        load_seconds = time.perf_counter() - start
+
+    queries = random_hashes[rng.integers(0, args.entries, args.lookups)].tolist()
+    for flipped in (0, args.radius, args.radius + 1):
+        noisy = []
+        for value in queries:
+            for bit in rng.choice(64, flipped, replace=False).tolist():
+                value ^= 1 << bit
+            noisy.append(value)
+        latencies = []
+        hits = 0
+        for value in noisy:
+            start = time.perf_counter()
+            hits += index.lookup(value, 'bench') is not None
+            latencies.append(time.perf_counter() - start)
+        results.append({
+            'measure': f'lookup, {flipped} bits off',
+            'median_bits': f'p50 {percentile(latencies, 50) * 1e6:.0f} us',
+            'max_bits': f'p99 {percentile(latencies, 99) * 1e6:.0f} us',
+            'within_radius_pct': round(100 * hits / len(noisy), 1)
+        })
+
+    print(f'{len(photos)} photos from {args.data or "synthetic data"}; radius {args.radius} bits; '
+          f'{args.entries} random entries: {add_seconds * 1e6:.1f} us per insert, loaded from disk in {load_seconds:.2f}s')
+    print_table(results, ['measure', 'median_bits', 'max_bits', 'within_radius_pct'])
+    return results
+
+# ------ UPLOAD INGESTION ------
+def _read_upload(app, path, body, headers):
+    """Run one ingestion path on a request for `body`; (bytes read from the body, status)"""
+    from werkzeug.test import EnvironBuilder
+    stream = io.BytesIO(body)
+    environ = EnvironBuilder(method='POST', input_stream=stream, content_length=len(body), headers=headers).get_environ()
+    with app.app.request_context(environ):
+        if path == 'files':
+            # The previous route: werkzeug parses the whole form, then the image is copied out and hashed
+            data = app.request.files['file'].read()
+            app.secure_image_hash(data)
+            status = 200 if app.sniff_image(data[:app.SNIFF_BYTES]) else 415
+        else:
+            try:
+                app.ingest_upload()
+                status = 200
+            except app.UploadError as e:
+                status = e.status
+    return stream.tell(), status
+
+def bench_ingest(args):
+    """Upload read time, peak Python memory and bytes read before a rejection: request.files vs streaming"""
+    app = load_app()
+    results = []
+    for size, fmt in itertools.product(args.sizes, args.formats):
+        width, height = (int(v) for v in size.split('x'))
+        body, headers = multipart_image(synthetic_leaf(width, height, fmt))
+        # A non-image of the same size, which the streaming path turns away after its first chunk
+        rejected, rejected_headers = multipart_image(bytes(len(body)), 'leaf.txt')
+        row = {'image': f'{size} {fmt}', 'upload_kb': round(len(body) / 1024)}
+        for path in ('files', 'streamed'):
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                _read_upload(app, path, body, headers)
+            row[f'{path}_ms'] = round((time.perf_counter() - start) / args.repeats * 1000, 2)
+            tracemalloc.start()
+            _read_upload(app, path, body, headers)
+            row[f'{path}_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            tracemalloc.stop()
+            consumed, status = _read_upload(app, path, rejected, rejected_headers)
+            row[f'{path}_reject_read_kb'] = round(consumed / 1024)
+            row[f'{path}_reject_status'] = status
+        results.append(row)
+
+    print_table(results, ['image', 'upload_kb', 'files_ms', 'streamed_ms', 'files_peak_mb', 'streamed_peak_mb',
+                          'files_reject_read_kb', 'streamed_reject_read_kb', 'streamed_reject_status'])
+    return results
+
+# ------ LOAD TEST ------
+LOAD_ENDPOINTS = {
+    'predict': ('POST', '/api/predict'),
+    'index': ('POST', '/'),
+    'dashboard': ('GET', '/dashboard')
+}
+
+class TestClientDriver:
+    """Sends requests in-process through Flask's test client, keeping the session cookie"""
+    def __init__(self, app, image):
+        self.client = app.app.test_client()
+        self.send('POST', '/', *multipart_image(image))  # A recorded prediction starts the web session
+
+    def send(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, data=body, headers=headers or {})
+        return response.status_code, response.get_data()
+
+class HttpDriver:
+    """Sends requests to a running server over HTTP, keeping the session cookie"""
+    def __init__(self, base_url, image):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.send('POST', '/', *multipart_image(image))
+
+    def send(self, method, path, body=None, headers=None):
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers or {}, method=method)
+        try:
+            with self.opener.open(request, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+def load_images(sizes, formats):
+    """Synthetic leaf photos in every size and format, as (name, bytes)"""
+    images = []
+    for seed, (size, fmt) in enumerate(itertools.product(sizes, formats)):
+        width, height = (int(v) for v in size.split('x'))
+        extension = 'jpg' if fmt == 'JPEG' else 'png'
+        images.append((f'{size}.{fmt.lower()}.{extension}', synthetic_leaf(width, height, fmt, seed)))
+    return images
+
+def run_load(drivers, endpoint, images, args, rss):
+    """Drive one endpoint with one driver per client thread and summarise latency, throughput and errors"""
+    method, path = LOAD_ENDPOINTS[endpoint]
+    counter = itertools.count()
+
+    def request(driver, i):
+        body = headers = None
+        if method == 'POST':
+            name, data = images[i % len(images)]
+            # Unique trailing bytes defeat the prediction cache unless cache hits are being measured
+            body, headers = multipart_image(data if args.cache_hits else data + uuid.uuid4().bytes, name)
+        start = time.perf_counter()
+        status, content = driver.send(method, path, body, headers)
+        failed = status >= 400 or (endpoint == 'predict' and b'"error"' in content)
+        return time.perf_counter() - start, failed
+
+    for i in range(args.warmup):
+        request(drivers[0], i)
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client(driver):
+        nonlocal errors
+        local, failures = [], 0
+        for i in counter:
+            if i >= args.requests:
+                break
+            latency, failed = request(driver, i)
+            local.append(latency)
+            failures += failed
+        with lock:
+            latencies.extend(local)
+            errors += failures
+
+    gc.collect()
+    before = rss()
+    threads = [threading.Thread(target=client, args=(driver,)) for driver in drivers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'endpoint': endpoint,
+        'concurrency': len(drivers),
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'error_rate': round(errors / max(1, len(latencies)), 4),
+        'rss_growth_mb': round(rss() - before, 1)
+    }
+
+def bench_load(args):
+    """Throughput, latency percentiles, memory growth and error rate of the web endpoints under load"""
+    # Offline: in-process fake Firestore and a throwaway ledger, for this process and the server
+    os.environ.setdefault('LEAF_FAKE_FIRESTORE', '1')
+    os.environ.setdefault('LEAF_LEDGER_PATH', ':memory:')
+    if not args.cache_hits:
+        # Unique bytes defeat the exact cache, but the near-duplicate index would still recognise the photos
+        os.environ.setdefault('LEAF_NEAR_DUPLICATE_RADIUS', '-1')
+    images = load_images(args.sizes, args.formats)
+    results = []
+
+    if 'client' in args.targets:
+        app = load_app()
+        drivers = [TestClientDriver(app, images[0][1]) for _ in range(args.concurrency)]
+        for endpoint in args.endpoints:
+            results.append({'target': 'client', **run_load(drivers, endpoint, images, args, resident_mb)})
+
+    if 'server' in args.targets:
+        base = f'http://127.0.0.1:{args.port}'
+        server = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT.format(path=os.path.abspath(args.app_dir),
+                                                                             port=args.port)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while http_status(f'{base}/api/ready') != 200:
+                if server.poll() is not None:
+                    raise RuntimeError('Server exited during startup')
+                time.sleep(0.05)
+            drivers = [HttpDriver(base, images[0][1]) for _ in range(args.concurrency)]
+            for endpoint in args.endpoints:
+                row = run_load(drivers, endpoint, images, args, lambda: resident_mb(server.pid))
+                results.append({'target': 'server', **row})
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{len(images)} images: {', '.join(args.sizes)} x {', '.join(args.formats)}")
+    print_table(results, ['target', 'endpoint', 'concurrency', 'requests', 'requests_per_sec', 'p50_ms',
+                          'p95_ms', 'p99_ms', 'error_rate', 'rss_growth_mb'])
+    return results
+
+# ------ REGRESSION CHECK ------
+# Direction in which each metric improves: 1 when higher is better, -1 when lower is better
+METRIC_DIRECTIONS = {
+    'requests_per_sec': 1, 'images_per_sec': 1,
+    'p50_ms': -1, 'p95_ms': -1, 'p99_ms': -1,
+    'error_rate': -1, 'rss_growth_mb': -1
+}
+
+def result_key(row):
+    """Identify a result row by its settings: every field that is not a float or a known metric"""
+    return tuple((name, value) for name, value in row.items()
+                 if name not in METRIC_DIRECTIONS and not isinstance(value, float))
+
+def bench_compare(args):
+    """Compare two saved runs of the same benchmark and flag metrics that got worse beyond the threshold"""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline['command'] != current['command']:
+        raise SystemExit(f"Cannot compare a {baseline['command']} run with a {current['command']} run")
+
+    baseline_rows = {result_key(row): row for row in baseline['results']}
+    results = []
+    for row in current['results']:
+        before = baseline_rows.get(result_key(row))
+        if before is None:
+            continue
+        label = ' '.join(str(value) for _, value in result_key(row))
+        for metric, direction in METRIC_DIRECTIONS.items():
+            old, new = before.get(metric), row.get(metric)
+            if old is None or new is None:
+                continue
+            if old:
+                change = (new - old) / abs(old)
+                regressed = change * direction < -args.threshold
+            else:
+                change = None
+                regressed = metric == 'error_rate' and new > 0
+            results.append({
+                'row': label,
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change': 'n/a' if change is None else f'{change:+.1%}',
+                'regression': regressed
+            })
+
+    print_table(results, ['row', 'metric', 'baseline', 'current', 'change', 'regression'])
+    regressions = [result for result in results if result['regression']]
+    print(f'{len(regressions)} regressions beyond {args.threshold:.0%}')
+    if regressions and args.fail:
+        raise SystemExit(1)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaf Disease Detection benchmarks')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batching = subparsers.add_parser('batching', help='Micro-batching scheduler latency and throughput')
+    batching.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    batching.add_argument('--clients', type=int, default=64, help='Concurrent callers')
+    batching.add_argument('--requests', type=int, default=512, help='Total requests per batch size')
+    batching.add_argument('--max-wait-ms', type=float, default=5.0)
+    batching.set_defaults(func=bench_batching)
+
+    ledger = subparsers.add_parser('ledger', help='Ledger append, startup and verification cost')
+    ledger.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    ledger.add_argument('--block-size', type=int, default=1000, help='Transactions per sealed block')
+    ledger.add_argument('--proofs', type=int, default=100, help='Inclusion proofs sampled per size')
+    ledger.set_defaults(func=bench_ledger)
+
+    records = subparsers.add_parser('records', help='Memory per million ERP records')
+    records.add_argument('--count', type=int, default=1000000)
+    records.add_argument('--users', type=int, default=1000, help='Distinct user IDs')
+    records.add_argument('--spill-rows', type=int, default=100000)
+    records.set_defaults(func=bench_records)
+
+    preprocess = subparsers.add_parser('preprocess', help='Image decode and preprocessing time and memory')
+    preprocess.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4000x3000'])
+    preprocess.add_argument('--formats', nargs='+', default=['JPEG', 'PNG', 'PNG-RGBA'])
+    preprocess.add_argument('--repeats', type=int, default=10)
+    preprocess.set_defaults(func=bench_preprocess)
+
+    pool = subparsers.add_parser('pool', help='Decode pool throughput per worker count')
+    pool.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4, 8, 16])
+    pool.add_argument('--executors', nargs='+', default=['thread', 'process'], choices=['thread', 'process'])
+    pool.add_argument('--size', default='1920x1080', help='Synthetic photo size')
+    pool.add_argument('--images', type=int, default=400)
+    pool.set_defaults(func=bench_pool)
+
+    modes = subparsers.add_parser('modes', help='CPU inference modes: latency, throughput, memory and drift')
+    modes.add_argument('--modes', nargs='+', default=['eager', 'channels_last', 'dynamic_int8', 'static_int8',
+                                                      'torchscript', 'compile', 'onnx'])
+    modes.add_argument('--batch-size', type=int, default=16)
+    modes.add_argument('--repeats', type=int, default=40)
+    modes.set_defaults(func=bench_modes)
+
+    startup = subparsers.add_parser('startup', help='Cold start: time to first response, readiness and first prediction')
+    startup.add_argument('--app-dir', default=os.path.dirname(os.path.abspath(__file__)),
+                         help='Checkout to start, e.g. a worktree of an older commit for comparison')
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--port', type=int, default=5100)
+    startup.set_defaults(func=bench_startup)
+
+    metrics = subparsers.add_parser('metrics', help='Instrumentation overhead per update and per prediction')
+    metrics.add_argument('--operations', type=int, default=1000000, help='Updates timed per metric operation')
+    metrics.add_argument('--predictions', type=int, default=2000, help='Cached predictions timed with and without metrics')
+    metrics.set_defaults(func=bench_metrics)
+
+    cascade = subparsers.add_parser('cascade', help='Model cascade accuracy and throughput per confidence threshold')
+    cascade.add_argument('--data', help='Photos to evaluate on; DIR/<class>/ subfolders give accuracy labels')
+    cascade.add_argument('--first-stage', default=os.environ.get('LEAF_CASCADE_MODEL_PATH', 'cascade_first_stage.pth'))
+    cascade.add_argument('--thresholds', type=float, nargs='+', default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+    cascade.add_argument('--mode', default='eager', help='Inference mode of the full model')
+    cascade.add_argument('--images', type=int, default=256, help='Most images evaluated')
+    cascade.add_argument('--batch-size', type=int, default=16)
+    cascade.set_defaults(func=bench_cascade)
+
+    tiles = subparsers.add_parser('tiles', help='Tiled inference latency per photo size and tile cap')
+    tiles.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4000x3000'])
+    tiles.add_argument('--max-tiles', type=int, nargs='+', default=[4, 8, 16, 32])
+    tiles.add_argument('--repeats', type=int, default=5)
+    tiles.set_defaults(func=bench_tiles)
+
+    near = subparsers.add_parser('near-duplicates', help='Perceptual-hash robustness and near-duplicate index speed')
+    near.add_argument('--data', help='Leaf photos to measure dHash distances on (synthetic when not given)')
+    near.add_argument('--photos', type=int, default=20)
+    near.add_argument('--radius', type=int, default=int(os.environ.get('LEAF_NEAR_DUPLICATE_RADIUS', '4')))
+    near.add_argument('--entries', type=int, default=1000000, help='Random entries in the timed index')
+    near.add_argument('--lookups', type=int, default=2000)
+    near.set_defaults(func=bench_near_duplicates)
+
+    ingest = subparsers.add_parser('ingest', help='Upload read time, memory and early rejection per upload size')
+    ingest.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4000x3000'])
+    ingest.add_argument('--formats', nargs='+', default=['JPEG', 'PNG'])
+    ingest.add_argument('--repeats', type=int, default=5)
+    ingest.set_defaults(func=bench_ingest)
+
+    load = subparsers.add_parser('load', help='Endpoint load test: throughput, latency, memory growth and errors')
+    load.add_argument('--targets', nargs='+', default=['client', 'server'], choices=['client', 'server'],
+                      help='Flask test client in this process and/or a real local server')
+    load.add_argument('--endpoints', nargs='+', default=list(LOAD_ENDPOINTS), choices=list(LOAD_ENDPOINTS))
+    load.add_argument('--sizes', nargs='+', default=['320x240', '1280x960', '4000x3000'])
+    load.add_argument('--formats', nargs='+', default=['JPEG', 'PNG', 'PNG-RGBA'])
+    load.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    load.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    load.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint')
+    load.add_argument('--cache-hits', action='store_true', help='Resend identical images so the cache answers')
+    load.add_argument('--app-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    load.add_argument('--port', type=int, default=5200)
+    load.set_defaults(func=bench_load)
+
+    compare = subparsers.add_parser('compare', help='Flag regressions between two --json results of one benchmark')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.15, help='Relative change counted as a regression')
+    compare.add_argument('--fail', action='store_true', help='Exit with status 1 when a regression is found')
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    results = args.func(args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'command': args.command,
+                'recorded_at': datetime.datetime.now().isoformat(),
+                'host': {'cpus': os.cpu_count(), 'machine': platform.machine(), 'python': platform.python_version()},
+                'results': results
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# decoding.py - Image decoding for the app and its preprocessing worker processes; imports only Pillow and numpy
+import io
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_SIZE = 224
+# Tiled inference: share of a tile overlapping its neighbour, and the most tiles one photo is cut into
+TILE_OVERLAP = min(0.9, max(0.0, float(os.environ.get('LEAF_TILE_OVERLAP', '0.25'))))
+TILE_MAX = max(1, int(os.environ.get('LEAF_TILE_MAX', '16')))
+EXIF_ORIENTATION = 0x0112
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a bytearray or memoryview, without copying the whole buffer"""
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        data = self._view[self._position:end].tobytes()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+def open_image(image_bytes):
+    """Open an upload with PIL; bytes and streamed bytearray/memoryview buffers are both read in place"""
+    if isinstance(image_bytes, bytes):
+        return Image.open(io.BytesIO(image_bytes))  # BytesIO shares an immutable bytes object
+    return Image.open(BufferReader(image_bytes))
+
+def decode_image(image_bytes, size=IMAGE_SIZE):
+    """Decode an upload into a (size, size, 3) RGB uint8 array"""
+    image = open_image(image_bytes)
+    # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when the photo is much larger than needed
+    image.draft('RGB', (size, size))
+    # Phones store rotation in EXIF rather than in the pixels
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize((size, size), Image.BILINEAR, reducing_gap=3.0)
+    return np.array(image)
+
+def tile_offsets(length, tile, count):
+    """`count` evenly spaced tile starts from 0 to length - tile"""
+    if count == 1:
+        return [0]
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+def tile_layout(width, height, tile=IMAGE_SIZE, overlap=TILE_OVERLAP, max_tiles=TILE_MAX):
+    """Size to resize a width x height photo to, and the grid of overlapping tiles covering it"""
+    stride = max(1, round(tile * (1 - overlap)))
+    def tiles_along(length):
+        return 1 + max(0, math.ceil((length - tile) / stride))
+    
+    # Full resolution when the tile cap allows it, otherwise shrink until the grid fits (short side >= one tile)
+    smallest = tile / min(width, height)
+    scale = max(1.0, smallest)
+    while True:
+        resized = (max(tile, round(width * scale)), max(tile, round(height * scale)))
+        cols, rows = tiles_along(resized[0]), tiles_along(resized[1])
+        if cols * rows <= max_tiles or scale <= smallest:
+            break
+        scale = max(smallest, scale * 0.9)
+    if cols * rows > max_tiles:
+        # Only very elongated photos get here: squeeze the long side so the capped tiles still cover it
+        if cols >= rows:
+            cols = max(1, max_tiles // rows)
+            resized = (min(resized[0], cols * tile), resized[1])
+        else:
+            rows = max(1, max_tiles // cols)
+            resized = (resized[0], min(resized[1], rows * tile))
+    return {
+        'size': resized,
+        'rows': rows,
+        'cols': cols,
+        'x': tile_offsets(resized[0], tile, cols),
+        'y': tile_offsets(resized[1], tile, rows)
+    }
+
+def decode_tiles(image_bytes, size=IMAGE_SIZE, max_tiles=TILE_MAX):
+    """Decode an upload into an (N, size, size, 3) uint8 stack of overlapping tiles and their grid"""
+    image = open_image(image_bytes)
+    # EXIF orientations 5-8 turn the photo a quarter, so its upright width is the stored height
+    turned = image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+    width, height = image.size[::-1] if turned else image.size
+    layout = tile_layout(width, height, size, max_tiles=max_tiles)
+    image.draft('RGB', layout['size'][::-1] if turned else layout['size'])
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    pixels = np.asarray(image.resize(layout['size'], Image.BILINEAR, reducing_gap=3.0))
+    
+    # Tile boxes are reported as (left, top, right, bottom) in the upright original photo's pixels
+    x_scale, y_scale = width / layout['size'][0], height / layout['size'][1]
+    tiles, boxes = [], []
+    for top in layout['y']:
+        for left in layout['x']:
+            tiles.append(pixels[top:top + size, left:left + size])
+            boxes.append([round(left * x_scale), round(top * y_scale),
+                          round((left + size) * x_scale), round((top + size) * y_scale)])
+    grid = {'width': width, 'height': height, 'rows': layout['rows'], 'cols': layout['cols'], 'boxes': boxes}
+    return np.stack(tiles), grid
+
+def decode_timed(image_bytes, size=IMAGE_SIZE, decoder=decode_image):
+    """decode_image (or decode_tiles) that also returns its duration, measured wherever the pool runs it"""
+    start = time.perf_counter()
+    pixels = decoder(image_bytes, size)
+    return pixels, time.perf_counter() - start
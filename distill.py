@@ -0,0 +1,115 @@
+# distill.py - Trains the cascade's first-stage MobileNetV3 to imitate the full ResNet18
+import argparse
+import importlib
+import os
+import random
+import time
+
+import numpy as np
+
+def image_paths(app, data_dir):
+    """Photo paths under DIR with their class index when they sit in a DIR/<class>/ subfolder"""
+    paths = []
+    for root, _, files in sorted(os.walk(data_dir)):
+        label = os.path.basename(root)
+        index = app.classes.index(label) if label in app.classes else None
+        paths.extend((os.path.join(root, name), index) for name in sorted(files)
+                     if name.lower().endswith(app.IMAGE_EXTENSIONS))
+    return paths
+
+def load_batch(app, items, augment, rng):
+    """Normalized batch of (image bytes, label) items, randomly flipped when augmenting"""
+    images = app.new_batch_buffer(len(items))
+    for row, (data, _) in zip(images, items):
+        pixels = app.decode_image(data)
+        if augment:
+            # Leaf photos have no canonical orientation
+            if rng.random() < 0.5:
+                pixels = pixels[:, ::-1]
+            if rng.random() < 0.5:
+                pixels = pixels[::-1]
+        app.normalize_into(np.ascontiguousarray(pixels), row)
+    return images
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the full model into the cascade's first stage")
+    parser.add_argument('--data', help='Leaf photos to train on; DIR/<class>/ subfolders add their labels to the loss')
+    parser.add_argument('--synthetic', type=int, default=256,
+                        help='Synthetic photos to use when --data is not given (pipeline check only)')
+    parser.add_argument('--output', default=os.environ.get('LEAF_CASCADE_MODEL_PATH', 'cascade_first_stage.pth'))
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--temperature', type=float, default=2.0, help='Softens the full model targets')
+    parser.add_argument('--label-weight', type=float, default=0.5, help='Weight of the label loss for labelled photos')
+    parser.add_argument('--holdout', type=float, default=0.1, help='Share of photos kept back to measure agreement')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LEAF_MODEL_WARMUP', '0')  # The teacher is loaded below; the app need not serve it
+    app = importlib.import_module('integrated-leaf-disease-project')
+    torch = app.torch
+    functional = torch.nn.functional
+    try:
+        # Strict: distilling the untrained fallback model would silently produce a useless first stage
+        teacher = app.load_model(app.MODEL_PATH, strict=True)
+    except Exception as e:
+        raise SystemExit(f'Cannot load the full model from {app.MODEL_PATH} ({type(e).__name__}: {e}); '
+                         f'set LEAF_MODEL_PATH to the trained checkpoint')
+    if args.data:
+        items = []
+        for path, label in image_paths(app, args.data):
+            with open(path, 'rb') as f:
+                items.append((f.read(), label))
+    else:
+        from benchmark import synthetic_leaf
+        print('No --data given: training on synthetic photos, which only checks the pipeline')
+        items = [(synthetic_leaf(640, 480, 'JPEG', seed), None) for seed in range(args.synthetic)]
+    rng = random.Random(0)
+    rng.shuffle(items)
+    holdout = max(1, int(len(items) * args.holdout))
+    train, validation = items[holdout:], items[:holdout]
+    if not train:
+        raise SystemExit(f'{len(items)} photos found and {len(validation)} held out, leaving none to train on; '
+                         f'add photos or lower --holdout')
+
+    student = app.build_first_stage()
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr)
+    print(f'{len(train)} training and {len(validation)} held-out photos from {args.data or "synthetic data"}')
+
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        student.train()
+        rng.shuffle(train)
+        total_loss = 0.0
+        for i in range(0, len(train), args.batch_size):
+            batch = train[i:i + args.batch_size]
+            images = load_batch(app, batch, True, rng)
+            with torch.no_grad():
+                targets = functional.softmax(teacher(images) / args.temperature, 1)
+            logits = student(images)
+            loss = functional.kl_div(functional.log_softmax(logits / args.temperature, 1), targets,
+                                     reduction='batchmean') * args.temperature ** 2
+            labelled = [j for j, (_, label) in enumerate(batch) if label is not None]
+            if labelled:
+                labels = torch.tensor([batch[j][1] for j in labelled])
+                loss = loss + args.label_weight * functional.cross_entropy(logits[labelled], labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+
+        student.eval()
+        agree = 0
+        with torch.no_grad():
+            for i in range(0, len(validation), args.batch_size):
+                images = load_batch(app, validation[i:i + args.batch_size], False, rng)
+                agree += (student(images).argmax(1) == teacher(images).argmax(1)).sum().item()
+        print(f'epoch {epoch + 1}: loss {total_loss / len(train):.4f}, '
+              f'agreement with the full model {agree / len(validation):.1%} ({time.perf_counter() - start:.0f}s)')
+
+    torch.save(student.state_dict(), args.output)
+    print(f'Saved first-stage model to {args.output}; evaluate thresholds with: '
+          f'python benchmark.py cascade --first-stage {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+# gunicorn.conf.py - Gunicorn settings; worker and thread counts come from serving_config.json (see autotune.py)
+import json
+import os
+import subprocess
+import sys
+
+config_path = os.environ.get('LEAF_SERVING_CONFIG', 'serving_config.json')
+
+# Tune once on first start when asked to; later starts reuse the saved configuration
+if os.environ.get('LEAF_AUTOTUNE') and not os.path.exists(config_path):
+    subprocess.run([sys.executable, 'autotune.py', '--quick', '--output', config_path], check=False)
+
+try:
+    with open(config_path) as f:
+        tuned = json.load(f)
+except (OSError, ValueError):
+    tuned = {}
+
+bind = os.environ.get('LEAF_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('LEAF_WORKERS', tuned.get('workers', 1)))
+# Threaded workers let concurrent requests share one micro-batch
+worker_class = 'gthread'
+threads = int(os.environ.get('LEAF_WORKER_THREADS', tuned.get('threads', 8)))
+timeout = 120
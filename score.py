@@ -0,0 +1,347 @@
+# score.py - Classifies a directory tree or manifest of leaf photos offline, resuming where a run stopped
+import argparse
+import csv
+import datetime
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.parquet': 'parquet'}
+
+# Set in each worker process by init_worker
+_app = None
+_buffer = None
+
+def load_app():
+    return importlib.import_module('integrated-leaf-disease-project')
+
+def iter_images(inputs, extensions):
+    """Image paths of every input in a stable order: directories are walked sorted, other files are manifests"""
+    for source in inputs:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        yield os.path.join(root, name)
+        else:
+            # One path per line, or a CSV whose first column is the path; relative paths are relative to the manifest
+            base = os.path.dirname(os.path.abspath(source))
+            with open(source, newline='') as f:
+                for row in csv.reader(f):
+                    if not row or not row[0].strip() or row[0].strip() == 'path':
+                        continue
+                    yield os.path.join(base, row[0].strip())
+
+def init_worker(torch_threads, batch_size):
+    """Load the model once per worker process; only the caller records to the ledger and ERP"""
+    global _app, _buffer
+    # Ctrl-C is handled by the caller, which checkpoints and stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ.update({
+        'LEAF_TORCH_THREADS': str(torch_threads),
+        'LEAF_INTEROP_THREADS': '1',
+        'LEAF_PREPROCESS_WORKERS': '0',
+        'LEAF_LEDGER_PATH': ':memory:',
+        'LEAF_FAKE_FIRESTORE': '1',
+        'LEAF_ERP_STORE_DIR': '',
+        'LEAF_CACHE_PATH': '',
+        'LEAF_NEAR_DUPLICATE_PATH': '',
+        'LEAF_SESSION_BACKEND': 'cookie'
+    })
+    _app = load_app()
+    _app.model_registry.current()
+    _buffer = _app.new_batch_buffer(batch_size)
+
+def _load_in_process(args):
+    global _app, _buffer
+    _app = load_app()
+    _buffer = _app.new_batch_buffer(args.batch_size)
+
+def app_settings():
+    """Class names and image extensions, read in a worker so the caller need not import the app"""
+    return _app.classes, _app.IMAGE_EXTENSIONS
+
+def skip_scored(paths, checkpoint):
+    """Skip the images a checkpoint covers, checking they are still the ones it scored; returns the path digest"""
+    digest = hashlib.sha256()
+    last = None
+    for last in itertools.islice(paths, checkpoint['offset']):
+        digest.update(os.fsencode(last) + b'\0')
+    if digest.hexdigest() != checkpoint.get('paths_digest') or last != checkpoint.get('last_path'):
+        raise SystemExit(f"Images were added, removed or renamed among the {checkpoint['offset']} already scored "
+                         f"(last scored: {checkpoint.get('last_path')}); pass --restart to start over")
+    return digest
+
+def score_batch(paths):
+    """Read, decode and classify a batch of photos in one forward pass; one result dict per path, in order"""
+    app = _app
+    results, pixels, decoded = [], [], []
+    for path in paths:
+        result = {'path': path, 'image_hash': None, 'prediction': None, 'confidence': None, 'stage': None,
+                  'error': None, 'probabilities': None}
+        try:
+            with open(path, 'rb') as f:
+                image_bytes = f.read()
+            result['image_hash'] = app.secure_image_hash(image_bytes)
+            pixels.append(app.decode_image(image_bytes))
+            decoded.append(result)
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {e}'
+        results.append(result)
+    if decoded:
+        images = app.normalize_batch(pixels, _buffer)
+        probabilities, stages = app.infer_batch(app.model_registry.get(), images)
+        for result, row, stage in zip(decoded, probabilities.tolist(), stages):
+            result['prediction'], result['confidence'], _ = app.describe_prediction(row)
+            result['stage'] = stage
+            result['probabilities'] = row
+    return results
+
+class LineWriter:
+    """CSV or NDJSON output appended in place; resuming truncates whatever was written after the checkpoint"""
+    def __init__(self, path, fmt, classes, state=None):
+        self.fmt = fmt
+        self.columns = ['path', 'image_hash', 'prediction', 'confidence', 'stage', 'error'] + [f'p_{c}' for c in classes]
+        self.classes = classes
+        if state is None:
+            self.file = open(path, 'wb')
+            if fmt == 'csv':
+                self._write_csv([self.columns])
+        else:
+            self.file = open(path, 'r+b')
+            self.file.truncate(state['bytes'])
+            self.file.seek(state['bytes'])
+
+    def _write_csv(self, rows):
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        self.file.write(text.getvalue().encode())
+
+    def write(self, results):
+        if self.fmt == 'csv':
+            self._write_csv([[result[c] for c in self.columns[:6]] + (result['probabilities'] or [None] * len(self.classes))
+                             for result in results])
+        else:
+            self.file.write(''.join(json.dumps(flatten(result, self.classes)) + '\n' for result in results).encode())
+
+    def mark(self):
+        """Position after the rows written so far"""
+        return self.file.tell()
+
+    def checkpoint(self, mark):
+        """Make the rows up to `mark` durable and return the position to resume from"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'bytes': mark}
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Parquet output as a directory with one part file per checkpoint"""
+    def __init__(self, path, classes, state=None):
+        import pyarrow  # Optional dependency, only needed for Parquet output
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.path = path
+        self.classes = classes
+        self.parts = state['parts'] if state else 0
+        self.rows = []
+        self.written = 0  # Rows passed to write, including those already in part files
+        os.makedirs(path, exist_ok=True)
+        # Parts written after the checkpoint belong to rows that will be scored again
+        for name in os.listdir(path):
+            if name.startswith('part-') and name.endswith('.parquet') and (state is None or int(name[5:-8]) >= self.parts):
+                os.remove(os.path.join(path, name))
+
+    def write(self, results):
+        self.rows.extend(flatten(result, self.classes) for result in results)
+        self.written += len(results)
+
+    def mark(self):
+        return self.written
+
+    def checkpoint(self, mark):
+        # Rows after the mark belong to a batch that will be scored again
+        keep = mark - (self.written - len(self.rows))
+        if keep > 0:
+            table = self.pyarrow.Table.from_pylist(self.rows[:keep])
+            self.parquet.write_table(table, os.path.join(self.path, f'part-{self.parts:05d}.parquet'))
+            self.parts += 1
+        self.rows = self.rows[max(0, keep):]
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+def flatten(result, classes):
+    """Result dict with one p_<class> field per class instead of the probability list"""
+    row = {key: value for key, value in result.items() if key != 'probabilities'}
+    probabilities = result['probabilities'] or [None] * len(classes)
+    row.update((f'p_{c}', p) for c, p in zip(classes, probabilities))
+    return row
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_checkpoint(path, checkpoint):
+    """Replace the checkpoint atomically so an interruption leaves the previous one intact"""
+    checkpoint['updated_at'] = datetime.datetime.now().isoformat()
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+def scored_batches(executor, batches, window):
+    """Results of each batch in submission order, keeping `window` batches in flight"""
+    if executor is None:
+        for batch in batches:
+            yield score_batch(batch)
+        return
+    in_flight = deque()
+    try:
+        for batch in batches:
+            in_flight.append(executor.submit(score_batch, batch))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify leaf photos in bulk with the served model')
+    parser.add_argument('inputs', nargs='+', help='Directories to walk, or manifests listing one image path per line')
+    parser.add_argument('--output', required=True, help='Results file (.csv, .ndjson) or Parquet directory (.parquet)')
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())), help='Default: from the output extension')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Inference processes; 0 scores in this process')
+    parser.add_argument('--torch-threads', type=int, default=1, help='Intra-op threads per worker')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass')
+    parser.add_argument('--checkpoint-every', type=int, default=10000, help='Images between checkpoints')
+    parser.add_argument('--record', action='store_true', help='Also record each prediction in the ledger and ERP')
+    parser.add_argument('--user-id', default='bulk_scoring', help='User the recorded predictions belong to')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+    args = parser.parse_args()
+
+    fmt = args.format or FORMATS.get(os.path.splitext(args.output)[1].lower(), 'csv')
+    checkpoint_path = f'{args.output.rstrip(os.sep)}.checkpoint'
+    inputs = [os.path.abspath(source) for source in args.inputs]
+    checkpoint = None if args.restart else read_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if checkpoint['inputs'] != inputs or checkpoint['format'] != fmt:
+            raise SystemExit(f'{checkpoint_path} belongs to another run; pass --restart to start over')
+        if checkpoint['complete']:
+            print(f"{args.output} is complete ({checkpoint['offset']} images); pass --restart to score again")
+            return
+        print(f"Resuming after {checkpoint['offset']} images")
+    else:
+        checkpoint = {'inputs': inputs, 'format': fmt, 'offset': 0, 'output': None, 'complete': False,
+                      'last_path': None, 'paths_digest': hashlib.sha256().hexdigest()}
+
+    if not args.record:
+        # Scoring alone must not touch the configured ledger or Firestore
+        os.environ['LEAF_LEDGER_PATH'] = ':memory:'
+        os.environ['LEAF_FAKE_FIRESTORE'] = '1'
+    app = executor = None
+    if args.workers > 0:
+        executor = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=init_worker, initargs=(args.torch_threads, args.batch_size))
+        # Only the workers load the model; this process needs the app just to record
+        classes, extensions = executor.submit(app_settings).result()
+        if args.record:
+            os.environ['LEAF_MODEL_WARMUP'] = '0'
+            app = load_app()
+    else:
+        _load_in_process(args)
+        app = _app
+        classes, extensions = app_settings()
+
+    # The walk is deterministic; the digest of the paths already scored shows whether it still is
+    paths = iter_images(inputs, extensions)
+    try:
+        digest = skip_scored(paths, checkpoint)
+    except SystemExit:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        raise
+    batches = iter(lambda: list(itertools.islice(paths, args.batch_size)), [])
+    if fmt == 'parquet':
+        writer = ParquetWriter(args.output, classes, checkpoint['output'])
+    else:
+        writer = LineWriter(args.output, fmt, classes, checkpoint['output'])
+
+    started = time.perf_counter()
+    scored = 0
+    # Progress as of the last batch handled completely: (offset, paths digest, output mark, last path,
+    # predictions to record). It is replaced in one assignment, so an interruption never checkpoints
+    # a batch that is only partly written, hashed or queued for recording.
+    done = (checkpoint['offset'], digest, writer.mark(), checkpoint['last_path'], [])
+
+    def save(complete=False):
+        offset, paths_digest, mark, last_path, pending = done
+        checkpoint['output'] = writer.checkpoint(mark)
+        if pending:
+            # Recorded before the checkpoint moves on: an interruption in between records these again on resume
+            app.blockchain.add_transactions([transaction for transaction, _ in pending])
+            app.erp_system.add_analysis_records([record for _, record in pending])
+            pending.clear()
+        checkpoint.update(offset=offset, paths_digest=paths_digest.hexdigest(), last_path=last_path, complete=complete)
+        write_checkpoint(checkpoint_path, checkpoint)
+
+    try:
+        for results in scored_batches(executor, batches, 2 * max(1, args.workers)):
+            offset, paths_digest, _, _, pending = done
+            paths_digest = paths_digest.copy()
+            for result in results:
+                paths_digest.update(os.fsencode(result['path']) + b'\0')
+            if args.record:
+                timestamp = datetime.datetime.now().isoformat()
+                pending = pending + [
+                    ((args.user_id, result['image_hash'], result['prediction']),
+                     (args.user_id, result['prediction'], result['confidence'], timestamp))
+                    for result in results if result['error'] is None
+                ]
+            writer.write(results)
+            done = (offset + len(results), paths_digest, writer.mark(), results[-1]['path'], pending)
+            scored += len(results)
+            if done[0] - checkpoint['offset'] >= args.checkpoint_every:
+                save()
+                elapsed = time.perf_counter() - started
+                print(f"{checkpoint['offset']} images scored ({scored / elapsed:.1f} images/sec)")
+        save(complete=True)
+    except KeyboardInterrupt:
+        # Batches handled completely are kept; a batch cut off part-way is scored again on resume
+        save()
+        print(f"Interrupted after {checkpoint['offset']} images; run the same command again to resume")
+    except Exception:
+        save()
+        print(f"Stopped after {checkpoint['offset']} images; run the same command again to resume")
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    if checkpoint['complete']:
+        print(f"Scored {checkpoint['offset']} images into {args.output} "
+              f"({scored} this run, {scored / max(elapsed, 1e-9):.1f} images/sec)")
+
+if __name__ == '__main__':
+    main()
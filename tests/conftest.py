@@ -0,0 +1,46 @@
+# conftest.py - Imports the Flask application module with offline, in-memory settings
+import importlib
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No Firebase credentials, ledger, ERP, cache or session files are touched by the tests
+os.environ.update({
+    'LEAF_FAKE_FIRESTORE': '1',
+    'LEAF_LEDGER_PATH': ':memory:',
+    'LEAF_ERP_STORE_DIR': '',
+    'LEAF_CACHE_PATH': '',
+    'LEAF_NEAR_DUPLICATE_PATH': '',
+    'LEAF_SECRET_KEY': 'test',
+    'LEAF_PREPROCESS_WORKERS': '0',
+    # Loaded by the first test that classifies, not on a thread the interpreter may exit under
+    'LEAF_MODEL_WARMUP': '0'
+})
+
+@pytest.fixture(scope='session')
+def leaf(tmp_path_factory):
+    # Untrained weights, so the app neither reads a real checkpoint nor downloads its fallback
+    import torch
+    import torchvision
+    path = tmp_path_factory.mktemp('model') / 'model.pth'
+    torch.manual_seed(0)
+    torch.save(torchvision.models.resnet18(weights=None, num_classes=5).state_dict(), path)
+    os.environ['LEAF_MODEL_PATH'] = str(path)
+    # The module's file name is not a valid identifier
+    return importlib.import_module('integrated-leaf-disease-project')
+
+@pytest.fixture
+def make_image():
+    """Encoded noise photos; each seed gives a different image"""
+    def make(seed=0, size=(64, 48), fmt='JPEG'):
+        pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, fmt)
+        return buffer.getvalue()
+    return make
@@ -0,0 +1,27 @@
+# test_analysis_stats.py - AnalysisStats totals and hourly/daily buckets
+import pytest
+
+def test_buckets_keep_confidence_and_users(leaf):
+    stats = leaf.AnalysisStats()
+    disease, other = leaf.classes[0], leaf.classes[1]
+    stats.add('a', disease, 80.0, '2024-05-01T10:15:00')
+    stats.add('a', disease, 60.0, '2024-05-01T10:45:00')
+    stats.add('b', other, 90.0, '2024-05-01T11:05:00')
+    snapshot = stats.snapshot()
+    
+    hour = snapshot['hourly']['2024-05-01T10']
+    assert hour['total'] == 2
+    assert hour['diseases'] == {disease: {'count': 2, 'mean_confidence': pytest.approx(70.0)}}
+    assert hour['users'] == {'a': 2}
+    
+    day = snapshot['daily']['2024-05-01']
+    assert day['total'] == 3
+    assert day['diseases'][other] == {'count': 1, 'mean_confidence': pytest.approx(90.0)}
+    assert day['users'] == {'a': 2, 'b': 1}
+
+def test_oldest_bucket_is_evicted(leaf, monkeypatch):
+    monkeypatch.setattr(leaf, 'STATS_HOURLY_RETENTION', 2)
+    stats = leaf.AnalysisStats()
+    for hour in range(3):
+        stats.add('a', leaf.classes[0], 50.0, f'2024-05-01T{hour:02d}:00:00')
+    assert list(stats.snapshot()['hourly']) == ['2024-05-01T01', '2024-05-01T02']
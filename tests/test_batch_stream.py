@@ -0,0 +1,58 @@
+# test_batch_stream.py - /api/predict/batch results streamed as NDJSON, one line per image
+import io
+import json
+import zipfile
+
+import pytest
+
+HEADERS = {'X-API-Key': 'demo_api_key', 'X-User-ID': 'batch_tester'}
+
+@pytest.fixture
+def client(leaf):
+    return leaf.app.test_client()
+
+def archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as f:
+        for name, data in members.items():
+            f.writestr(name, data)
+    return buffer.getvalue()
+
+def post(client, files, query='?stream=1', **headers):
+    data = {'files': [(io.BytesIO(content), name) for name, content in files]}
+    return client.post(f'/api/predict/batch{query}', data=data, headers={**HEADERS, **headers},
+                       content_type='multipart/form-data')
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_streams_one_line_per_image_including_archive_members(leaf, client, make_image):
+    files = [
+        ('a.jpg', make_image(1)),
+        ('photos.zip', archive({'b.jpg': make_image(2), 'notes.txt': b'skipped', 'c.png': make_image(3, fmt='PNG')})),
+        ('broken.jpg', b'not an image')
+    ]
+    response = post(client, files)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    results = lines(response)
+    assert [result['filename'] for result in results] == ['a.jpg', 'b.jpg', 'c.png', 'broken.jpg']
+    assert all(result['prediction'] in leaf.classes for result in results[:3])
+    assert 'error' in results[3]
+    # The same photo again is answered from the prediction cache
+    assert lines(post(client, [('again.jpg', make_image(1))]))[0]['cached']
+
+def test_accept_header_also_selects_ndjson(client, make_image):
+    response = post(client, [('a.jpg', make_image(4))], query='', Accept='application/x-ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(lines(response)) == 1
+
+def test_invalid_archive_ends_the_stream_with_an_error_line(client, make_image):
+    results = lines(post(client, [('a.jpg', make_image(5)), ('bad.zip', b'not a zip')]))
+    # Images still in flight when the archive fails to open are neither reported nor recorded
+    assert all('filename' in result for result in results[:-1])
+    assert results[-1] == {'error': results[-1]['error']}
+    assert results[-1]['error'].startswith('Invalid archive')
+
+def test_api_key_is_required(client, make_image):
+    assert post(client, [('a.jpg', make_image(6))], **{'X-API-Key': 'wrong'}).status_code == 403
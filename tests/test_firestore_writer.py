@@ -0,0 +1,104 @@
+# test_firestore_writer.py - FirestoreWriter batching, retries, backpressure and shutdown against FakeFirestore
+import threading
+import time
+
+import pytest
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+def make_writer(leaf, db=None, gate=None, **options):
+    """FirestoreWriter on a fake client; with a gate, the connection stays pending until it is set"""
+    db = db or leaf.FakeFirestore()
+    def connect():
+        if gate is not None:
+            gate.wait()
+        return db
+    options.setdefault('flush_seconds', 60.0)
+    options.setdefault('backoff_seconds', 0.001)
+    return leaf.FirestoreWriter(leaf.CloudConnection(connect), 'records', **options), db
+
+def records(count):
+    return [{'n': n} for n in range(count)]
+
+def stored(db):
+    return sorted(record['n'] for record in db.collections.get('records', {}).values())
+
+def test_flushes_full_batches(leaf):
+    writer, db = make_writer(leaf, batch_size=3)
+    for record in records(7):
+        assert writer.add(record)
+    wait_for(lambda: writer.info()['commits'] == 2)
+    assert writer.info()['written'] == 6
+    writer.close()
+    assert writer.info()['commits'] == 3
+    assert stored(db) == list(range(7))
+
+def test_flushes_partial_batch_after_interval(leaf):
+    writer, db = make_writer(leaf, batch_size=100, flush_seconds=0.05)
+    for record in records(2):
+        writer.add(record)
+    wait_for(lambda: writer.info()['written'] == 2)
+    assert writer.info()['commits'] == 1
+    assert db.commits == 1
+    writer.close()
+
+def test_failed_commit_is_retried(leaf):
+    db = leaf.FakeFirestore()
+    db.fail_commits = 2
+    writer, _ = make_writer(leaf, db, max_retries=5)
+    writer.add({'n': 0})
+    writer.close()
+    info = writer.info()
+    assert (info['retries'], info['written'], info['failed']) == (2, 1, 0)
+    assert stored(db) == [0]
+
+def test_records_fail_after_last_retry(leaf):
+    db = leaf.FakeFirestore()
+    db.fail_commits = 10
+    writer, _ = make_writer(leaf, db, max_retries=2)
+    for record in records(3):
+        writer.add(record)
+    writer.close()
+    info = writer.info()
+    assert (info['retries'], info['written'], info['failed']) == (2, 0, 3)
+    assert stored(db) == []
+
+def test_full_queue_drops_after_put_timeout(leaf):
+    gate = threading.Event()
+    writer, db = make_writer(leaf, gate=gate, max_queue=2)
+    assert writer.add({'n': 0}) and writer.add({'n': 1})
+    start = time.monotonic()
+    assert not writer.add({'n': 2}, timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+    assert writer.info()['dropped'] == 1
+    gate.set()
+    writer.close()
+    assert stored(db) == [0, 1]
+
+def test_close_drains_queue(leaf):
+    writer, db = make_writer(leaf, batch_size=100)
+    for record in records(5):
+        writer.add(record)
+    writer.close()
+    assert writer.info()['written'] == 5
+    assert writer.queue_depth() == 0
+    assert stored(db) == list(range(5))
+    with pytest.raises(RuntimeError):
+        writer.add({'n': 5})
+
+def test_records_are_dropped_without_cloud(leaf):
+    gate = threading.Event()
+    def connect():
+        gate.wait()
+        raise RuntimeError('no credentials')
+    writer = leaf.FirestoreWriter(leaf.CloudConnection(connect), 'records')
+    # Queued while connecting, then discarded once the connection has failed
+    assert writer.add({'n': 0})
+    gate.set()
+    wait_for(lambda: writer.info()['dropped'] == 1)
+    assert not writer.add({'n': 1})
+    writer.close()
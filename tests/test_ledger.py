@@ -0,0 +1,89 @@
+# test_ledger.py - Merkle proofs, ledger verification and ledgers written before Merkle roots
+import hashlib
+import json
+import sqlite3
+
+import pytest
+
+def transaction(n):
+    return {'user_id': f'user{n}', 'image_hash': f'{n:064x}', 'prediction': 'Anthracnose', 'timestamp': f't{n}'}
+
+@pytest.fixture
+def ledger_path(tmp_path):
+    return str(tmp_path / 'ledger.db')
+
+@pytest.mark.parametrize('count', [1, 2, 5, 8])
+def test_merkle_proof_of_every_transaction_verifies(leaf, count):
+    transactions = [transaction(n) for n in range(count)]
+    leaf_hashes = [leaf.hash_transaction(tx) for tx in transactions]
+    root = leaf.merkle_root(leaf_hashes)
+    for position, tx in enumerate(transactions):
+        proof = leaf.merkle_proof(leaf_hashes, position)
+        assert leaf.verify_merkle_proof(tx, proof, root)
+        assert not leaf.verify_merkle_proof({**tx, 'prediction': 'Powdery_Mildew'}, proof, root)
+
+def test_sealed_transactions_are_proven_and_tampering_is_detected(leaf, ledger_path):
+    ledger = leaf.SimpleBlockchain(ledger_path, max_transactions=3, max_seconds=0)
+    indices = ledger.add_transactions([('u', f'image{n}', 'Anthracnose') for n in range(4)])
+    assert indices == [2, 2, 2, 3]
+    
+    proof = ledger.prove('image1')
+    assert (proof['status'], proof['block_index'], proof['position']) == ('sealed', 2, 1)
+    assert leaf.verify_merkle_proof(proof['transaction'], proof['proof'], proof['merkle_root'])
+    assert ledger.prove('image3')['status'] == 'pending'
+    assert ledger.prove('unknown') is None
+    assert ledger.verify()
+    
+    ledger._db.execute("UPDATE transactions SET prediction = 'Powdery_Mildew' WHERE image_hash = 'image1'")
+    # Incremental verification resumes after the verified height; a full one re-checks every block
+    assert ledger.verify()
+    assert not ledger.verify(full=True)
+    ledger.close()
+
+def legacy_hash(block):
+    """Block hash as ledgers before Merkle roots computed it, over the full transaction list"""
+    fields = ('index', 'timestamp', 'proof', 'previous_hash', 'transactions')
+    return hashlib.sha256(json.dumps({key: block[key] for key in fields}, sort_keys=True).encode()).hexdigest()
+
+def write_legacy_ledger(path):
+    """Genesis, one sealed block of two transactions and one unsealed transaction, without Merkle columns"""
+    db = sqlite3.connect(path)
+    db.executescript('''
+        CREATE TABLE blocks (idx INTEGER PRIMARY KEY, timestamp TEXT, proof INTEGER,
+                             previous_hash TEXT, hash TEXT, tx_count INTEGER);
+        CREATE TABLE transactions (block_index INTEGER, position INTEGER, user_id TEXT, image_hash TEXT,
+                                   prediction TEXT, timestamp TEXT, created REAL,
+                                   PRIMARY KEY (block_index, position));
+    ''')
+    previous_hash = '0'
+    for index, transactions in ((1, []), (2, [transaction(0), transaction(1)])):
+        block = {'index': index, 'timestamp': f'block{index}', 'proof': 1, 'previous_hash': previous_hash,
+                 'transactions': transactions}
+        previous_hash = legacy_hash(block)
+        db.execute('INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?)',
+                   (index, block['timestamp'], 1, block['previous_hash'], previous_hash, len(transactions)))
+        for position, tx in enumerate(transactions):
+            db.execute('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (index, position, tx['user_id'], tx['image_hash'], tx['prediction'], tx['timestamp'], 0.0))
+    tx = transaction(2)
+    db.execute('INSERT INTO transactions VALUES (3, 0, ?, ?, ?, ?, 0.0)',
+               (tx['user_id'], tx['image_hash'], tx['prediction'], tx['timestamp']))
+    db.commit()
+    db.close()
+
+def test_legacy_ledger_opens_verifies_and_seals_with_merkle_roots(leaf, ledger_path):
+    write_legacy_ledger(ledger_path)
+    ledger = leaf.SimpleBlockchain(ledger_path, max_transactions=2, max_seconds=0)
+    assert ledger.verify(full=True)
+    assert ledger.prove(transaction(1)['image_hash'])['status'] == 'legacy'
+    
+    # The unsealed legacy transaction was hashed on open, so its block seals with a Merkle root
+    assert ledger.add_transaction('u', 'new image', 'Anthracnose') == 3
+    proof = ledger.prove(transaction(2)['image_hash'])
+    assert (proof['status'], proof['block_index']) == ('sealed', 3)
+    assert leaf.verify_merkle_proof(proof['transaction'], proof['proof'], proof['merkle_root'])
+    assert ledger.verify(full=True)
+    
+    ledger._db.execute("UPDATE transactions SET prediction = 'Powdery_Mildew' WHERE block_index = 2")
+    assert not ledger.verify(full=True)
+    ledger.close()
@@ -0,0 +1,55 @@
+# test_near_duplicates.py - NearDuplicateIndex lookups within the radius and its shared file
+import time
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+def probabilities(leaf, value):
+    # Exact in float32, as the index stores them
+    return [value] * len(leaf.classes)
+
+def test_lookup_finds_hashes_within_the_radius(leaf):
+    index = leaf.NearDuplicateIndex(radius=4)
+    image_dhash = 0x0123456789ABCDEF
+    index.add(image_dhash, 'v1', probabilities(leaf, 0.5))
+    assert index.lookup(image_dhash, 'v1') == probabilities(leaf, 0.5)
+    # Four flipped bits, all in one 16-bit chunk or spread over several
+    assert index.lookup(flip(image_dhash, 0, 1, 2, 3), 'v1') == probabilities(leaf, 0.5)
+    assert index.lookup(flip(image_dhash, 5, 20, 40, 60), 'v1') == probabilities(leaf, 0.5)
+    assert index.lookup(flip(image_dhash, 5, 20, 40, 60, 63), 'v1') is None
+    assert index.lookup(image_dhash, 'v2') is None
+    assert (index.info()['hits'], index.info()['misses']) == (3, 2)
+
+def test_closest_entry_wins_after_a_rebuild(leaf):
+    index = leaf.NearDuplicateIndex(radius=4, tail_size=2)
+    index.add(0, 'v1', probabilities(leaf, 0.25))
+    index.add(flip(0, 0, 1, 2, 3), 'v1', probabilities(leaf, 0.75))
+    deadline = time.monotonic() + 5
+    while index.info()['indexed'] < 2:
+        assert time.monotonic() < deadline, 'index was not rebuilt'
+        time.sleep(0.005)
+    assert index.lookup(flip(0, 0), 'v1') == probabilities(leaf, 0.25)
+    assert index.lookup(flip(0, 0, 1, 2), 'v1') == probabilities(leaf, 0.75)
+
+def test_file_is_shared_between_indexes_and_survives_a_torn_record(leaf, tmp_path):
+    path = str(tmp_path / 'index.bin')
+    first = leaf.NearDuplicateIndex(path, radius=4)
+    second = leaf.NearDuplicateIndex(path, radius=4)
+    first.add(1, 'v1', probabilities(leaf, 0.25))
+    assert second.lookup(flip(1, 8), 'v1') == probabilities(leaf, 0.25)
+    second.add(2 ** 40, 'v1', probabilities(leaf, 0.5))
+    first.add(2 ** 50, 'v1', probabilities(leaf, 0.75))
+    # Entries from the other index are taken in by the next lookup
+    assert second.lookup(2 ** 50, 'v1') == probabilities(leaf, 0.75)
+    assert len(first) == len(second) == 3
+    first.close()
+    second.close()
+    
+    with open(path, 'ab') as f:
+        f.write(b'torn')
+    reopened = leaf.NearDuplicateIndex(path, radius=4)
+    assert len(reopened) == 3
+    assert reopened.lookup(2 ** 40, 'v1') == probabilities(leaf, 0.5)
+    reopened.close()
@@ -0,0 +1,41 @@
+# test_prediction_cache.py - PredictionCache LRU eviction, expiry and the SQLite tier
+import pytest
+
+@pytest.fixture
+def clock(leaf, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(leaf.time, 'time', lambda: now[0])
+    return now
+
+def test_least_recently_used_entry_is_evicted(leaf):
+    cache = leaf.PredictionCache(max_entries=2)
+    cache.put('a', 'v1', [1.0])
+    cache.put('b', 'v1', [2.0])
+    assert cache.get('a', 'v1') == [1.0]
+    cache.put('c', 'v1', [3.0])
+    assert cache.get('b', 'v1') is None
+    assert cache.get('a', 'v1') == [1.0]
+    assert cache.get('c', 'v1') == [3.0]
+    assert cache.info()['entries'] == 2
+
+def test_entries_expire_and_model_versions_are_separate(leaf, clock):
+    cache = leaf.PredictionCache(ttl_seconds=10)
+    cache.put('a', 'v1', [1.0])
+    assert cache.get('a', 'v2') is None
+    clock[0] += 9
+    assert cache.get('a', 'v1') == [1.0]
+    clock[0] += 2
+    assert cache.get('a', 'v1') is None
+    info = cache.info()
+    assert (info['hits'], info['misses'], info['entries']) == (1, 2, 0)
+
+def test_disk_tier_survives_a_restart_until_expiry(leaf, clock, tmp_path):
+    path = str(tmp_path / 'cache.db')
+    leaf.PredictionCache(ttl_seconds=10, path=path).put('a', 'v1', [0.25, 0.75])
+    
+    restarted = leaf.PredictionCache(ttl_seconds=10, path=path)
+    assert restarted.get('a', 'v1') == [0.25, 0.75]
+    assert restarted.info()['disk_hits'] == 1
+    
+    clock[0] += 11
+    assert leaf.PredictionCache(ttl_seconds=10, path=path).get('a', 'v1') is None
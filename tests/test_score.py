@@ -0,0 +1,58 @@
+# test_score.py - Bulk scoring checkpoints and resume
+import csv
+import sys
+
+import pytest
+
+import score
+
+@pytest.fixture
+def photos(tmp_path, make_image):
+    directory = tmp_path / 'photos'
+    directory.mkdir()
+    for n in range(10):
+        (directory / f'leaf{n:02d}.png').write_bytes(make_image(n, (32, 32), 'PNG'))
+    return directory
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['score.py', '--workers', '0', '--batch-size', '3', *map(str, args)])
+    score.main()
+
+def scored_paths(output):
+    with open(output, newline='') as f:
+        return [row['path'] for row in csv.DictReader(f)]
+
+def test_resume_after_interrupt_inside_a_write(leaf, monkeypatch, photos, tmp_path):
+    output = tmp_path / 'out.csv'
+    write = score.LineWriter.write
+    calls = []
+    def interrupted(self, results):
+        calls.append(results)
+        if len(calls) == 2:
+            # Half of the second batch reaches the file before Ctrl-C
+            write(self, results[:1])
+            raise KeyboardInterrupt
+        write(self, results)
+    monkeypatch.setattr(score.LineWriter, 'write', interrupted)
+    run(monkeypatch, photos, '--output', output, '--checkpoint-every', '100')
+    monkeypatch.setattr(score.LineWriter, 'write', write)
+    run(monkeypatch, photos, '--output', output)
+    
+    paths = scored_paths(output)
+    assert paths == sorted(str(path) for path in photos.iterdir())
+
+def test_resume_refused_when_scored_images_change(leaf, monkeypatch, photos, tmp_path):
+    output = tmp_path / 'out.csv'
+    write = score.LineWriter.write
+    calls = []
+    def interrupted(self, results):
+        calls.append(results)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        write(self, results)
+    monkeypatch.setattr(score.LineWriter, 'write', interrupted)
+    run(monkeypatch, photos, '--output', output)
+    monkeypatch.setattr(score.LineWriter, 'write', write)
+    (photos / 'leaf00.png').unlink()
+    with pytest.raises(SystemExit, match='added, removed or renamed'):
+        run(monkeypatch, photos, '--output', output)
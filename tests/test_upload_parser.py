@@ -0,0 +1,65 @@
+# test_upload_parser.py - UploadParser size limits and image type sniffing on streamed multipart bodies
+import hashlib
+
+import pytest
+
+BOUNDARY = 'leafboundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+def multipart(data, filename='leaf.jpg', fields=()):
+    parts = [f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields]
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+def feed(parser, body, chunk_size=1000):
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start:start + chunk_size])
+    parser.feed(b'')
+
+def test_image_part_is_hashed_and_sniffed_across_chunks(leaf, make_image):
+    data = make_image(0, (200, 150))
+    parser = leaf.UploadParser(CONTENT_TYPE)
+    feed(parser, multipart(data, fields=[('tiles', '1')]), chunk_size=7)
+    upload = parser.result()
+    assert bytes(upload.data) == data
+    assert upload.image_hash == hashlib.sha256(data).hexdigest()
+    assert (upload.filename, upload.kind, upload.fields) == ('leaf.jpg', 'jpeg', {'tiles': '1'})
+
+@pytest.mark.parametrize('fmt, kind', [('PNG', 'png'), ('GIF', 'gif'), ('BMP', 'bmp'), ('WEBP', 'webp'), ('TIFF', 'tiff')])
+def test_other_image_formats_are_recognised(leaf, make_image, fmt, kind):
+    parser = leaf.UploadParser(CONTENT_TYPE)
+    feed(parser, multipart(make_image(0, fmt=fmt)))
+    assert parser.result().kind == kind
+
+def test_declared_length_over_the_limit_is_rejected_before_reading(leaf):
+    with pytest.raises(leaf.UploadError) as error:
+        leaf.UploadParser(CONTENT_TYPE, content_length=10 ** 9, max_bytes=1000)
+    assert error.value.status == 413
+
+def test_image_over_the_limit_is_rejected_while_streaming(leaf, make_image):
+    parser = leaf.UploadParser(CONTENT_TYPE, max_bytes=1000)
+    with pytest.raises(leaf.UploadError) as error:
+        feed(parser, multipart(make_image(0, (200, 150))))
+    assert error.value.status == 413
+
+def test_non_image_is_rejected_at_its_first_chunk(leaf):
+    body = multipart(b'%PDF-1.7 ' + b'x' * 100000, filename='leaf.pdf')
+    parser = leaf.UploadParser(CONTENT_TYPE)
+    with pytest.raises(leaf.UploadError) as error:
+        parser.feed(body[:1000])
+    assert error.value.status == 415
+
+@pytest.mark.parametrize('content_type, body, status', [
+    ('application/json', None, 400),
+    (CONTENT_TYPE, f'--{BOUNDARY}--\r\n'.encode(), 400),
+    (CONTENT_TYPE, multipart(b'', filename=''), 400),
+    (CONTENT_TYPE, multipart(b''), 415)
+])
+def test_missing_or_empty_file_part(leaf, content_type, body, status):
+    with pytest.raises(leaf.UploadError) as error:
+        parser = leaf.UploadParser(content_type)
+        feed(parser, body)
+        parser.result()
+    assert error.value.status == status